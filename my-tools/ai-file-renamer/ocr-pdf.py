@@ -7,15 +7,22 @@
 
 This script will recursively search a directory for PDF files and run OCR on
 them. It will log the results. It runs OCR on every file, even if it already
-has text. OCRmyPDF will detect files that already have text.
+has text. OCRmyPDF will detect files that already have text. Files whose
+content hash is recorded in the cache from a previous run are skipped.
 
 You should edit this script to meet your needs.
 """
 
 from __future__ import annotations
 
-import filecmp
+import hashlib
 import logging
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
 import ocrmypdf
@@ -23,99 +30,252 @@ import argparse
 from ocrmypdf.exceptions import InputFileError
 import ocrmypdf.languages
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
 
 # pylint: disable=logging-format-interpolation
 # pylint: disable=logging-not-lazy
 
 
-def filecompare(a, b):
+# Define OCR settings in a dictionary for easier management. These are passed
+# as keyword arguments, so names use underscores rather than CLI hyphens
+ocr_settings = {
+    'force_ocr': False,  # OCRmyPDF will detect files that already have text
+    'redo_ocr':True,
+    'language': 'heb+script/Hebrew+eng', # English and Hebrew languages
+    'output_type': 'pdf',
+    'oversample': 300,
+    'progress_bar': False,  # Progress bars from parallel workers would interleave
+    'skip_text': False,
+    'pdf_renderer':'auto',
+    'sidecar': '',
+    'clean_final': False,
+    'clean': False,
+    'remove_background': False,
+    'optimize':3,
+    'continue_on_soft_render_error': True,
+    'deskew': False,
+    'jobs': 4,  # Threads per file; the pool runs cpu_count // 4 files at once
+}
+
+CACHE_BATCH_SIZE = 32
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    # Prefix the algorithm so entries stay valid if blake3 is installed later
+    if blake3 is not None:
+        algo, h = "blake3", blake3.blake3()
+    else:
+        algo, h = "blake2b", hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return f"{algo}:{h.hexdigest()}"
+
+
+def open_cache(cache_path):
+    conn = sqlite3.connect(cache_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS done (hash TEXT PRIMARY KEY, path TEXT, mtime REAL)"
+    )
+    # hash is the primary key; index path too so both lookups stay point queries
+    conn.execute("CREATE INDEX IF NOT EXISTS done_path ON done(path)")
+    conn.commit()
+    return conn
+
+
+def cached_mtime(conn, path):
+    row = conn.execute(
+        "SELECT mtime FROM done WHERE path = ? ORDER BY mtime DESC LIMIT 1", (str(path),)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def is_done(conn, digest):
+    return conn.execute("SELECT 1 FROM done WHERE hash = ?", (digest,)).fetchone() is not None
+
+
+def flush_cache(conn, pending):
+    if pending:
+        conn.executemany(
+            "INSERT OR REPLACE INTO done (hash, path, mtime) VALUES (?, ?, ?)", pending
+        )
+        conn.commit()
+        pending.clear()
+
+
+def walk_pdfs(start_dir, paths, exclude_dir=None):
+    # fwalk keeps a directory fd open, so entries are not re-resolved from the root
+    try:
+        for dirpath, dirnames, filenames, _dirfd in os.fwalk(start_dir):
+            if exclude_dir:
+                # Never OCR the archived originals
+                dirnames[:] = [d for d in dirnames if Path(dirpath, d).resolve() != exclude_dir]
+            for name in filenames:
+                if name.lower().endswith(".pdf"):
+                    paths.put(Path(dirpath, name))
+    finally:
+        paths.put(None)
+
+
+def record_result(future, cache, pending):
     try:
-        return filecmp.cmp(a, b, shallow=True)
-    except FileNotFoundError:
-        return False
-
-
-script_dir = Path(__file__)
-
-parser = argparse.ArgumentParser(
-    description="Recursively OCR PDFs in a directory."
-)
-parser.add_argument(
-    "start_dir",
-    nargs="?",
-    type=Path,
-    default=Path("."),
-    help="Directory to start searching for PDFs (default: current directory)",
-)
-parser.add_argument(
-    "--log-file",
-    type=Path,
-    default=script_dir.with_name("ocr-tree.log"),
-    help="Path to the log file (default: ocr-tree.log in script directory)",
-)
-parser.add_argument(
-    "--archive-dir",
-    type=Path,
-    default="archive",  
-    help="Path for backup original documents. If not provided, no archiving will be done.",
-)
-
-args = parser.parse_args()
-
-start_dir = args.start_dir
-log_file = args.log_file
-archive_dir = args.archive_dir
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(message)s",
-    filename=log_file,
-    filemode="a",
-)
-
-logging.info(f"Start directory {start_dir}")
-
-ocrmypdf.configure_logging(ocrmypdf.Verbosity.default)
-
-for filename in start_dir.glob("**/*.pdf"):
+        filename, digest = future.result()
+    except Exception as e:
+        logging.error(f"Worker failed: {e}")
+        return
+    logging.info(f"Finished {filename}")
+    if digest:
+        try:
+            mtime = filename.stat().st_mtime
+        except OSError as e:
+            logging.error(f"Could not stat {filename}: {e}")
+            return
+        pending.append((digest, str(filename), mtime))
+        if len(pending) >= CACHE_BATCH_SIZE:
+            flush_cache(cache, pending)
+
+
+def init_worker(log_file):
+    # Workers may be spawned rather than forked, so configure logging again
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(message)s",
+        filename=log_file,
+        filemode="a",
+    )
+    ocrmypdf.configure_logging(ocrmypdf.Verbosity.default)
+
+
+def process_one(filename, archive_filename, digest):
     logging.info(f"Processing {filename}")
-    archive_filename = archive_dir / filename.relative_to(start_dir)
-        
-    if archive_dir and not filecompare(filename, archive_filename):
-            logging.info(f"Archiving document to {archive_filename}")
-            #try:
-             #   shutil.copy2(filename, archive_filename.parent)
-            #except OSError:
-             #   os.makedirs(archive_filename.parent, exist_ok=True)
-              #  shutil.copy2(filename, archive_filename.parent)
+
+    # Never overwrite an archived original. A new version at the same path is
+    # archived next to it under its pre-OCR digest; if that copy already exists
+    # this exact original is backed up and there is nothing to do
+    if archive_filename and archive_filename.exists():
+        archive_filename = archive_filename.with_stem(
+            f"{archive_filename.stem}.{digest.split(':')[-1][:12]}"
+        )
+    if archive_filename and not archive_filename.exists():
+        logging.info(f"Archiving document to {archive_filename}")
+        try:
+            os.makedirs(archive_filename.parent, exist_ok=True)
+            shutil.copy2(filename, archive_filename)
+        except OSError as e:
+            logging.error(f"Could not archive {filename}: {e}")
+            return filename, None
     try:
-        # Define OCR settings in a dictionary for easier management
-            ocr_settings = {
-                'force_ocr': False,  # OCRmyPDF will detect files that already have text
-                'redo_ocr':True,
-                'language': 'heb+script/Hebrew+eng', # English and Hebrew languages
-                'output_type': 'pdf',
-                'oversample': 300,
-                'progress_bar': True,
-                'skip_text': False,
-                'pdf-renderer':'auto',
-                'sidecar': '',
-                'clean-final': False,
-                'clean': False,
-                'remove-background': False,
-                'optimize':3,
-                'continue-on-soft-render-error': True,
-                'deskew': False,
-
-
-            }
-            result = ocrmypdf.ocr(filename, filename,  **ocr_settings)
-            logging.info(result)
+        result = ocrmypdf.ocr(filename, filename,  **ocr_settings)
+        logging.info(result)
+        if result in (ocrmypdf.ExitCode.ok, ocrmypdf.ExitCode.already_done_ocr):
+            # The file is rewritten in place, so cache the digest of the output
+            return filename, file_digest(filename)
     except InputFileError as e:
-            logging.error(f"Input file error for {filename}: {e}")
+        logging.error(f"Input file error for {filename}: {e}")
     except ChildProcessError as e:
-            logging.error(f"OCRmyPDF child process error for {filename}: {e}")
+        logging.error(f"OCRmyPDF child process error for {filename}: {e}")
     except Exception as e:
-            logging.error(f"Unhandled error occurred for {filename}: {e}")
-            logging.error(e.__traceback__)
+        logging.error(f"Unhandled error occurred for {filename}: {e}")
+        logging.error(e.__traceback__)
+    return filename, None
+
+
+def main():
+    script_dir = Path(__file__)
+
+    parser = argparse.ArgumentParser(
+        description="Recursively OCR PDFs in a directory."
+    )
+    parser.add_argument(
+        "start_dir",
+        nargs="?",
+        type=Path,
+        default=Path("."),
+        help="Directory to start searching for PDFs (default: current directory)",
+    )
+    parser.add_argument(
+        "--log-file",
+        type=Path,
+        default=script_dir.with_name("ocr-tree.log"),
+        help="Path to the log file (default: ocr-tree.log in script directory)",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        type=Path,
+        default="archive",  
+        help="Path for backup original documents. If not provided, no archiving will be done.",
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=Path,
+        default=script_dir.with_name("ocr-cache.sqlite"),
+        help="Path to the cache of already processed files (default: ocr-cache.sqlite in script directory)",
+    )
+
+    args = parser.parse_args()
+
+    start_dir = args.start_dir
+    log_file = args.log_file
+    archive_dir = args.archive_dir
+    cache = open_cache(args.cache_file)
+    pending = []
+
+    init_worker(log_file)
+
+    logging.info(f"Start directory {start_dir}")
+
+    # Each file gets ocr_settings['jobs'] threads, so the pool and OCRmyPDF
+    # together keep every core busy without oversubscribing
+    max_workers = max(1, (os.cpu_count() or 1) // ocr_settings['jobs'])
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_worker, initargs=(log_file,)
+        ) as executor:
+            # Walk the tree in the background and keep only a bounded number of
+            # files queued or in flight, so memory stays flat on huge trees
+            max_in_flight = 2 * max_workers
+            paths = queue.Queue(maxsize=max_in_flight)
+            exclude_dir = archive_dir.resolve() if archive_dir else None
+            threading.Thread(
+                target=walk_pdfs, args=(start_dir, paths, exclude_dir), daemon=True
+            ).start()
+            in_flight = set()
+            while (filename := paths.get()) is not None:
+                try:
+                    # Unchanged since we last wrote it: skip without hashing the file
+                    if cached_mtime(cache, filename) == filename.stat().st_mtime:
+                        logging.info(f"Skipping {filename}, unchanged since last run")
+                        continue
+                    digest = file_digest(filename)
+                except OSError as e:
+                    # Broken symlink, unreadable file: log it and keep walking
+                    logging.error(f"Could not read {filename}: {e}")
+                    continue
+                if is_done(cache, digest):
+                    logging.info(f"Skipping {filename}, already processed")
+                    continue
+                archive_filename = (
+                    archive_dir / filename.relative_to(start_dir) if archive_dir else None
+                )
+                in_flight.add(executor.submit(process_one, filename, archive_filename, digest))
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record_result(future, cache, pending)
+            for future in wait(in_flight).done:
+                record_result(future, cache, pending)
+    finally:
+        # Keep the results that finished even if the run is interrupted
+        flush_cache(cache, pending)
+        cache.close()
     logging.info("OCR complete")
+
+
+if __name__ == "__main__":
+    main()
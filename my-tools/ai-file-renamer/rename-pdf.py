@@ -1,19 +1,121 @@
 import os
 import re
-import ocrmypdf
+import json
 import tempfile
 import logging
 import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import requests
+from requests.adapters import HTTPAdapter
 from tenacity import retry , stop_after_attempt, wait_exponential, retry_if_exception_type
 import subprocess
 # To run this code you need to install the following dependencies:
 # pip install google-genai
+# Optional, avoids spawning a pdftotext process per file:
+# pip install pdftotext
+try:
+    import pdftotext
+except ImportError:
+    pdftotext = None
 
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
+# Gemini free tier allows 15 requests per minute
+GEMINI_RPM = 15
+MAX_WORKERS = 8
+
+# Below these thresholds extracted text is treated as OCR noise
+MIN_TEXT_LENGTH = 20
+MIN_ALPHA_RATIO = 0.3
+MIN_WORD_COUNT = 4
+
+# Most of the signal for a title is in the first couple of KB
+PROMPT_TEXT_BUDGET = 2000
+PROMPT_TEXT_TAIL = 200
+
+# The ocrmypdf API is not thread-safe, so OCR fallbacks run one at a time
+_ocr_lock = threading.Lock()
+
+
+class RateLimitError(Exception):
+    """Raised when the Gemini API rejects a request with HTTP 429."""
+
+
+class RateLimiter:
+    """
+    Space out calls across threads so at most `rpm` requests start per minute.
+    """
+    def __init__(self, rpm):
+        self.set_rpm(rpm)
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def set_rpm(self, rpm):
+        self.interval = 60.0 / rpm
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+gemini_limiter = RateLimiter(GEMINI_RPM)
+
+# Settings for the OCR fallback, passed to ocrmypdf.ocr() as keyword arguments
+ocr_settings = {
+    'force_ocr': False,  # OCRmyPDF will detect files that already have text
+    'redo_ocr':True,
+    'language': 'heb+script/Hebrew+eng', # English and Hebrew languages
+    'output_type': 'pdf',
+    'oversample': 300,
+    'progress_bar': True,
+    'skip_text': False,
+    'pdf_renderer':'auto',
+    'sidecar': '',
+    'clean_final': False,
+    'clean': False,
+    'remove_background': False,
+    'optimize':3,
+    'continue_on_soft_render_error': True,
+    'deskew': False,
+}
+
+# Reuse TLS connections to the Gemini endpoint across files and worker threads
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=0))
+
+
+def read_pdf_text(pdf_path, last_page):
+    """
+    Return the text of the first `last_page` pages, or None if extraction failed.
+    Uses the in-process poppler bindings when available, else the pdftotext CLI.
+    """
+    if pdftotext is not None:
+        try:
+            with open(pdf_path, "rb") as f:
+                pdf = pdftotext.PDF(f)
+                return "\n".join(pdf[i] for i in range(min(last_page, len(pdf)))).strip()
+        except (pdftotext.Error, OSError) as e:
+            logging.error(f"pdftotext failed for {pdf_path}: {e}")
+            return None
+
+    result = subprocess.run(
+        ["pdftotext", "-f", "1", "-l", str(last_page), "-enc", "UTF-8", pdf_path, "-"],
+        capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0:
+        logging.error(f"pdftotext failed for {pdf_path}: {result.stderr}")
+        return None
+    return result.stdout.strip()
+
 
 def extract_text_from_first_page(pdf_path):
     """
@@ -22,55 +124,31 @@ def extract_text_from_first_page(pdf_path):
     """
     # First, try extracting text from the first page using pdftotext
     try:
-        result = subprocess.run(
-            ["pdftotext", "-f", "1", "-l", "2", "-enc", "UTF-8", pdf_path, "-"],
-            capture_output=True, text=True, timeout=30
-        )
-        if result.returncode == 0:
-            text = result.stdout.strip()
-            if len(text) >= 50:
-                return text
+        text = read_pdf_text(pdf_path, 2)
+        if text and len(text) >= 50:
+            return text
     except subprocess.TimeoutExpired:
         logging.warning(f"pdftotext timed out for {pdf_path}")
     except FileNotFoundError:
         logging.error("pdftotext not found. Install poppler-utils (pdftotext).")
         return ""
 
-    # Fallback to OCR with ocrmypdf API
+    # Fallback to OCR with ocrmypdf API. Imported here because it pulls in a
+    # large dependency graph that most files, having a text layer, never need
     logging.info("Fallback to OCR using ocrmypdf.")
+    import ocrmypdf
     try:
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_pdf = os.path.join(temp_dir, "ocr_output.pdf")
-            ocr_settings = {
-                'force_ocr': False,  # OCRmyPDF will detect files that already have text
-                'redo_ocr':True,
-                'language': 'heb+script/Hebrew+eng', # English and Hebrew languages
-                'output_type': 'pdf',
-                'oversample': 300,
-                'progress_bar': True,
-                'skip_text': False,
-                'pdf-renderer':'auto',
-                'sidecar': '',
-                'clean-final': False,
-                'clean': False,
-                'remove-background': False,
-                'optimize':3,
-                'continue-on-soft-render-error': True,
-                'deskew': False,
-                }
             # OCR the PDF using the Python API
-            ocrmypdf.ocr(pdf_path, temp_pdf, language='heb+eng', **ocr_settings)
+            with _ocr_lock:
+                ocrmypdf.ocr(pdf_path, temp_pdf, **ocr_settings)
 
             # Extract text from the OCR'd PDF
-            text_result = subprocess.run(
-                ["pdftotext", "-f", "1", "-l", "3", "-enc", "UTF-8", temp_pdf, "-"],
-                capture_output=True, text=True, timeout=30
-            )
-            if text_result.returncode == 0:
-                text = text_result.stdout.strip()
+            text = read_pdf_text(temp_pdf, 3)
+            if text is not None:
                 return text
-            else:
-                logging.error(f"pdftotext failed after OCR: {text_result.stderr}")
+            logging.error("pdftotext failed after OCR")
     except ocrmypdf.exceptions.ExitCodeError as e:
         logging.error(f"ocrmypdf API failed: {e}")
     except subprocess.TimeoutExpired:
@@ -79,6 +157,11 @@ def extract_text_from_first_page(pdf_path):
         logging.error("pdftotext not found. Install poppler-utils (pdftotext).")
 
     return ""
+# Characters invalid in filenames (<>:"/\|?* and control characters)
+_SANITIZE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?*' + ''.join(map(chr, range(0x20)))})
+_SANITIZE_UNDERSCORES = re.compile(r'_+')
+
+
 def sanitize_filename(title):
     """
     Sanitize the title to make it a valid filename.
@@ -88,20 +171,32 @@ def sanitize_filename(title):
     if not title:
         return "untitled.pdf"
     # Replace invalid characters with underscores
-    sanitized = re.sub(r'[<>:"/\\|?*\x00-\x1F]', '_', title)
+    sanitized = title.translate(_SANITIZE_TABLE)
     # Collapse multiple underscores and remove leading/trailing ones
-    sanitized = re.sub(r'_+', '_', sanitized).strip('_')
+    sanitized = _SANITIZE_UNDERSCORES.sub('_', sanitized).strip('_')
     # Limit length
     return sanitized[:150] or "untitled.pdf"
 
 
+def truncate_for_prompt(pdf_text):
+    """
+    Keep the head of the text (title, authors, headers) plus a short tail,
+    where dates and signatures often appear, within PROMPT_TEXT_BUDGET chars.
+    """
+    if len(pdf_text) <= PROMPT_TEXT_BUDGET:
+        return pdf_text
+    head = PROMPT_TEXT_BUDGET - PROMPT_TEXT_TAIL
+    return pdf_text[:head] + "\n...\n" + pdf_text[-PROMPT_TEXT_TAIL:]
+
+
+@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=2, min=10, max=60), retry=retry_if_exception_type(RateLimitError), reraise=True)
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), retry=retry_if_exception_type(requests.RequestException))
 def generate_title_with_gemini(pdf_text, api_key, model=str):
     """
     Use the Gemini API to generate a file title based on the PDF text content.
     Updated to use an active model (flash for speed; switch to pro for long docs).
     """
-    headers = {'Content-Type': 'application/json'}
+    headers = {'Content-Type': 'application/json; charset=utf-8'}
     prompt = """You are tasked to suggest a filename for a PDF document. The provided text is EXTRACTED FROM THE FIRST 2 PAGEs ONLY—it may be incomplete, OCR-generated (possibly with errors), or insufficient to fully represent the document.
 Your goal: Propose a concise, descriptive title as the filename in the document's ORIGINAL LANGUAGE. Make it filename-safe (no special characters, spaces allowed if simple). Keep under 120 characters.
 Respond ONLY with the filename text—NO explanations, NO prefixes/suffixes like 'Title:', NO markdown, NO additional text. Just the clean filename.
@@ -115,14 +210,20 @@ Guidelines:
 - Pensions Yearly Reports: 'Menora Pension Yearly Report-2021 John Smith' (good); 'Detailed yearly pension summary for retirement fund with charts and projections for future benefits' (bad).
 Important: Always try to find the best possible informative name !
 Analyze the text below and output ONLY the filename:"""
-    full_text = prompt + "\n" + pdf_text
+    full_text = prompt + "\n" + truncate_for_prompt(pdf_text)
     data = {
         "contents": [{"parts": [{"text": full_text}]}]
     }
+    # Send UTF-8 instead of \uXXXX escapes, which triple the size of Hebrew text
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
 
     url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}'
-    response = requests.post(url, json=data, headers=headers)
+    gemini_limiter.wait()
+    response = _session.post(url, data=body, headers=headers, timeout=30)
 
+    if response.status_code == 429:
+        logging.warning("Gemini rate limit hit, backing off.")
+        raise RateLimitError(response.text)
     if response.status_code != 200:
         logging.error(f"API request failed with status code: {response.status_code}")
         logging.error(f"Response: {response.text}")
@@ -140,6 +241,16 @@ Analyze the text below and output ONLY the filename:"""
         return ""
 
 
+def is_insufficient_text(pdf_text):
+    """
+    Locally reject text the prompt would answer with 'Insufficient-Content',
+    saving the API round-trip: too short, too few words or mostly non-letters.
+    """
+    alpha_ratio = sum(c.isalpha() for c in pdf_text) / max(len(pdf_text), 1)
+    word_count = len(pdf_text.split())
+    return len(pdf_text) < MIN_TEXT_LENGTH or alpha_ratio < MIN_ALPHA_RATIO or word_count < MIN_WORD_COUNT
+
+
 def rename_pdf(pdf_path, api_key, dry_run=False, model='gemini-2.5-flash'):
     """
     Extract PDF text, generate title using Gemini, and rename the file.
@@ -149,6 +260,9 @@ def rename_pdf(pdf_path, api_key, dry_run=False, model='gemini-2.5-flash'):
     if not pdf_text:
         logging.warning("No text extracted from the PDF.")
         return
+    if is_insufficient_text(pdf_text):
+        logging.warning(f"Extracted text from {pdf_path} looks like noise. Skipping Gemini call.")
+        return
 
     new_title = generate_title_with_gemini(pdf_text, api_key, model)
     if not new_title:
@@ -161,32 +275,57 @@ def rename_pdf(pdf_path, api_key, dry_run=False, model='gemini-2.5-flash'):
     sanitized_title = sanitize_filename(new_title) + ".pdf"
     new_path = os.path.join(os.path.dirname(pdf_path), sanitized_title)
 
-    if not os.path.exists(new_path):
-        os.rename(pdf_path, new_path)
-        logging.info(f"Renamed to: {new_path}")
-    else:
+    # Claim the target name atomically so concurrent workers that resolve to
+    # the same title cannot overwrite each other
+    try:
+        fd = os.open(new_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
         logging.warning(f"File with name '{sanitized_title}' already exists. Skipping.")
+        return
+    os.close(fd)
+    try:
+        os.replace(pdf_path, new_path)
+    except OSError:
+        os.remove(new_path)
+        raise
+    logging.info(f"Renamed to: {new_path}")
+
+
+def rename_pdf_logged(pdf_path, api_key, dry_run=False, model=str):
+    logging.info(f"Processing: {pdf_path}")
+    try:
+        rename_pdf(pdf_path, api_key, dry_run=dry_run, model=model)
+    except Exception as e:
+        logging.error(f"Error processing {pdf_path}: {e}")
 
 
-def rename_pdfs_in_directory(directory_path, api_key, dry_run=False, model=str):
-    # Iterate through all PDF files in a directory and rename them.
-    for filename in os.listdir(directory_path):
-        if filename.lower().endswith('.pdf'):
-            pdf_path = os.path.join(directory_path, filename)
-            logging.info(f"Processing: {pdf_path}")
-            try:
-                rename_pdf(pdf_path, api_key, dry_run=dry_run, model=model)
-            except Exception as e:
-                logging.error(f"Error processing {pdf_path}: {e}")
+def rename_pdfs_in_directory(directory_path, api_key, dry_run=False, model=str, rpm=GEMINI_RPM):
+    # Rename all PDF files in a directory, overlapping the Gemini round-trips.
+    # scandir gets the file type from readdir, avoiding a stat() per entry
+    with os.scandir(directory_path) as it:
+        pdf_paths = [entry.path for entry in it if entry.is_file() and entry.name.lower().endswith('.pdf')]
+    gemini_limiter.set_rpm(rpm)
+    max_workers = max(1, min(MAX_WORKERS, rpm // 4))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(partial(rename_pdf_logged, api_key=api_key, dry_run=dry_run, model=model), pdf_paths))
 
 
 # === Main Execution ===
+def positive_int(value):
+    # RateLimiter divides by rpm, and a negative rate would disable limiting altogether
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description="Batch rename PDFs using Gemini AI.")
     parser.add_argument('--directory', '-d', required=True,default='.' ,help='Path to directory containing PDFs.')
     parser.add_argument('--api-key', '-k', help='Gemini API key (or set GOOGLE_API_KEY env var).')
     parser.add_argument('--dry-run', action='store_true', help='Preview renames without renaming files.')
     parser.add_argument('--model', '-m', default='gemini-flash-lite-latest', help='Gemini model (e.g., gemini-1.5-flash).')
+    parser.add_argument('--rpm', type=positive_int, default=GEMINI_RPM, help=f'Gemini requests per minute quota (default: {GEMINI_RPM}).')
     args = parser.parse_args()
 
     api_key = args.api_key or os.getenv('GOOGLE_API_KEY')
@@ -194,7 +333,7 @@ def main():
         logging.error("API key required via --api-key or GOOGLE_API_KEY env var.")
         return
 
-    rename_pdfs_in_directory(args.directory, api_key, dry_run=args.dry_run, model=args.model)
+    rename_pdfs_in_directory(args.directory, api_key, dry_run=args.dry_run, model=args.model, rpm=args.rpm)
 
 
 if __name__ == "__main__":
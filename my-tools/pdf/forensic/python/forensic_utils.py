@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+#############################################
+# Script: forensic_utils.py
+# Purpose:
+#   Helper module for the forensic CLIs.
+#   Tool lookup, job defaults and the evidence-safe filesystem helpers
+#   shared by pdforensic_cli.py, pdforensic_cli_ultimate_v2.py and
+#   pdforensic_full.py. Standard library only (no PyMuPDF), so the
+#   poppler-only tools keep working without it.
+#############################################
+
+import os
+import shutil
+from pathlib import Path
+
+
+def resolve_tools(names):
+    # Resolved once per process; a missing tool maps to None and its step is skipped
+    return {tool: shutil.which(tool) for tool in names}
+
+def default_jobs():
+    # Leave headroom for the workers ocrmypdf starts inside each job
+    return max(1, (os.cpu_count() or 1) // 2)
+
+def link_or_copy(src, dst):
+    # A hardlink shares the evidence bytes at no I/O cost; copy whenever linking is
+    # not possible (other filesystem, exFAT/SMB without hardlinks, no permission).
+    # An existing dst is never written through: it may itself be a hardlink to
+    # another evidence file, so both paths create dst exclusively
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        with open(src, "rb") as fi, open(dst, "xb") as fo:
+            shutil.copyfileobj(fi, fo, 1 << 20)
+
+def make_output_dir(base):
+    # mkdir is atomic, so names that clash ("a b.pdf"/"a_b.pdf", "x.pdf"/"x.PDF",
+    # the same file twice in one second) get numbered siblings instead of sharing one folder
+    path, n = base, 1
+    while True:
+        try:
+            path.mkdir(parents=True)
+            return path
+        except FileExistsError:
+            n += 1
+            path = base.with_name(f"{base.name}_{n}")
+
+def list_pdfs(folder):
+    # One readdir pass; DirEntry answers is_file() without an extra stat, and .PDF counts too
+    with os.scandir(folder) as it:
+        return [Path(e.path) for e in it if e.is_file(follow_symlinks=False) and e.name.lower().endswith(".pdf")]
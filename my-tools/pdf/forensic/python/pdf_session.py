@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#############################################
+# Script: pdf_session.py
+# Purpose:
+#   Helper module for the forensic CLIs.
+#   Opens a PDF once with PyMuPDF (fitz) and serves metadata, text and
+#   embedded images from the same parsed document, instead of running
+#   pdfinfo, pdftotext and pdfimages, which each re-parse the file.
+# Usage:
+#   with PdfSession(pdf) as session:
+#       session.write_metadata(outdir / "pdf_info.txt")
+#       session.write_text(outdir)
+#       session.extract_images(outdir)
+#############################################
+
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+# fitz metadata keys → pdfinfo labels
+METADATA_LABELS = {
+    "title": "Title",
+    "subject": "Subject",
+    "keywords": "Keywords",
+    "author": "Author",
+    "creator": "Creator",
+    "producer": "Producer",
+    "creationDate": "CreationDate",
+    "modDate": "ModDate",
+    "trapped": "Trapped",
+    "encryption": "Encryption",
+    "format": "PDF version",
+}
+
+
+class PdfSession:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.doc = None
+
+    def __enter__(self):
+        self.doc = fitz.open(self.path)
+        return self
+
+    def __exit__(self, *exc):
+        self.doc.close()
+
+    def metadata_dict(self):
+        metadata = self.doc.metadata or {}
+        info = {label: metadata[key] for key, label in METADATA_LABELS.items() if metadata.get(key)}
+        info["Pages"] = self.doc.page_count
+        info["Encrypted"] = "yes" if self.doc.is_encrypted else "no"
+        info["File size"] = f"{self.path.stat().st_size} bytes"
+        return info
+
+    def write_metadata(self, out_path):
+        # Same "Key:   value" layout as pdfinfo
+        with open(out_path, "w", encoding="utf-8") as f:
+            for key, value in self.metadata_dict().items():
+                f.write(f"{key + ':':<16}{value}\n")
+
+    def write_text(self, outdir):
+        # Pages are separated by form feeds, like pdftotext
+        text = "\f".join(page.get_text() for page in self.doc)
+        (outdir / "text.txt").write_text(text, encoding="utf-8")
+
+    def extract_images(self, outdir):
+        outdir.mkdir(parents=True, exist_ok=True)
+        for pno in range(len(self.doc)):
+            for idx, info in enumerate(self.doc.get_page_images(pno, full=True)):
+                img = self.doc.extract_image(info[0])
+                if img:
+                    (outdir / f"img-p{pno:04d}-{idx}.{img['ext']}").write_bytes(img["image"])
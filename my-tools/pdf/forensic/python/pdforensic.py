@@ -22,14 +22,14 @@ from pathlib import Path
 
 def run_command(cmd, output_file=None):
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        result = subprocess.run(cmd, capture_output=True, text=True)
         if output_file:
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(result.stdout)
         else:
             print(result.stdout)
     except Exception as e:
-        print(f"❌ Error running command: {cmd}\n{e}")
+        print(f"❌ Error running command: {' '.join(cmd)}\n{e}")
 
 def main():
     if len(sys.argv) < 2:
@@ -48,16 +48,16 @@ def main():
     print(f"[→] Output dir: {output_dir}")
 
     # Step 1: Metadata
-    run_command(f'exiftool -a -G1 -s "{pdf_path}"', output_dir / "metadata.txt")
+    run_command(["exiftool", "-a", "-G1", "-s", str(pdf_path)], output_dir / "metadata.txt")
 
     # Step 2: QPDF structural check
-    run_command(f'qpdf --check "{pdf_path}"', output_dir / "qpdf_check.txt")
+    run_command(["qpdf", "--check", str(pdf_path)], output_dir / "qpdf_check.txt")
 
     # Step 3: Text extraction
-    run_command(f'pdftotext "{pdf_path}" "{output_dir}/text.txt"')
+    run_command(["pdftotext", str(pdf_path), str(output_dir / "text.txt")])
 
     # Step 4: PDF Info (structure)
-    run_command(f'pdfinfo "{pdf_path}"', output_dir / "pdfinfo.txt")
+    run_command(["pdfinfo", str(pdf_path)], output_dir / "pdfinfo.txt")
 
     print("\n✅ Done. Check output in:", output_dir)
 
@@ -4,7 +4,7 @@
 # Purpose:
 #   A simple and clean CLI tool for forensic analysis of PDF files.
 #   It processes a single PDF or all PDFs in a folder, extracting:
-#     - Metadata (pdfinfo, exiftool)
+#     - Metadata (trailer /Info scan, pdfinfo as fallback; exiftool with --deep-metadata)
 #     - Text (pdftotext)
 #     - Embedded images (pdfimages)
 #     - OCR output (ocrmypdf) including:
@@ -15,28 +15,122 @@
 #   A summary CSV file logs all processed PDFs and their output paths.
 # Notes:
 #   - Can be hooked into Finder right-click or Automator
-#   - All commands are run via subprocess with captured output
+#   - All commands are run via subprocess (no shell) with captured output
 #############################################
-import os
-import shutil
+import argparse
+import mmap
+import re
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 import csv
 
+from forensic_utils import default_jobs, link_or_copy, list_pdfs, make_output_dir, resolve_tools
+
 # ========== CONFIGURATION ==========
 OUTPUT_BASE = Path("forensic_results")
 LANGUAGES = "heb+eng"
 DPI = 600
+TOOLS = resolve_tools(["pdfinfo", "exiftool", "pdftotext", "pdfimages", "ocrmypdf"])
+TRAILER_SCAN = 64 * 1024  # the trailer (or xref stream dict) lives in the file's tail
+INFO_KEYS = ["Title", "Subject", "Keywords", "Author", "Creator", "Producer", "CreationDate", "ModDate"]
+INFO_REF = re.compile(rb'/Info\s+(\d+)\s+(\d+)\s+R')
+PDF_VERSION = re.compile(rb'%PDF-(\d\.\d)')
+OCTAL_ESCAPE = re.compile(rb'[0-7]{1,3}')
+STRING_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f", b"\r": b"", b"\n": b""}
 
 # ========== UTILS ==========
-def run_cmd(cmd, logfile=None, cwd=None):
-    print(f"\n🔧  Running: {cmd}\n")
-    with open(logfile, 'w') if logfile else subprocess.DEVNULL as f:
-        result = subprocess.run(cmd, shell=True, cwd=cwd, stdout=f, stderr=subprocess.STDOUT, text=True)
-    if result.returncode != 0:
-        print(f"❌  Command failed: {cmd}")
-    return result
+def run_cmd(argv, logfile=None, cwd=None):
+    # Start the command without waiting; collect it later with wait_all()
+    exe = TOOLS.get(argv[0])
+    if not exe:
+        print(f"⚠️  Skipping {argv[0]} (not installed)")
+        return None
+    print(f"\n🔧  Running: {' '.join(argv)}\n")
+    argv = [exe, *argv[1:]]
+    if not logfile:
+        return subprocess.Popen(argv, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    with open(logfile, 'w') as f:
+        return subprocess.Popen(argv, cwd=cwd, stdout=f, stderr=subprocess.STDOUT)
+
+def wait_all(procs):
+    for proc in filter(None, procs):
+        if proc.wait() != 0:
+            print(f"❌  Command failed: {' '.join(proc.args)}")
+
+def read_pdf_string(buf, pos):
+    # Literal (...) string with nested parens and escapes, or <hex> string
+    if buf[pos:pos + 1] == b"<":
+        digits = re.sub(rb"\s", b"", buf[pos + 1:buf.index(b">", pos)]).decode("ascii")
+        raw = bytes.fromhex(digits + "0" * (len(digits) % 2))  # odd length: last digit is padded
+    else:
+        out, depth, i = bytearray(), 1, pos + 1
+        while depth and i < len(buf):
+            c = buf[i:i + 1]
+            if c == b"\\":
+                octal = OCTAL_ESCAPE.match(buf, i + 1, i + 4)
+                if octal:
+                    out.append(int(octal.group(), 8) & 0xFF)
+                    i = octal.end()
+                    continue
+                nxt = buf[i + 1:i + 2]
+                out += STRING_ESCAPES.get(nxt, nxt)
+                i += 2
+                continue
+            depth += (c == b"(") - (c == b")")
+            if depth:
+                out += c
+            i += 1
+        raw = bytes(out)
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", errors="replace")
+    return raw.decode("latin-1")
+
+def find_object(buf, num, gen):
+    # Last definition wins, as with incremental updates; skip "12 0 obj" matching "112 0 obj"
+    needle = b"%d %d obj" % (num, gen)
+    pos = buf.rfind(needle)
+    while pos > 0 and buf[pos - 1:pos].isdigit():
+        pos = buf.rfind(needle, 0, pos)
+    return pos
+
+def fast_metadata(path):
+    # Read /Info straight from the trailer instead of starting pdfinfo.
+    # Returns {} when that is not possible (encrypted, /Info in an object stream, damaged file)
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            tail = buf[max(0, len(buf) - TRAILER_SCAN):]
+            refs = INFO_REF.findall(tail)
+            if not refs or b"/Encrypt" in tail:
+                return {}
+            num, gen = refs[-1]  # the newest incremental update comes last
+            obj = find_object(buf, int(num), int(gen))
+            if obj < 0:
+                return {}
+            end = buf.find(b"endobj", obj)
+            body = buf[obj:end if end > 0 else len(buf)]
+
+            info = {}
+            for key in INFO_KEYS:
+                m = re.search(rb"/" + key.encode() + rb"\s*([(<])", body)
+                value = read_pdf_string(body, m.start(1)).strip() if m else ""
+                if value:
+                    info[key] = value
+            version = PDF_VERSION.match(buf, 0, 16)
+            if version:
+                info["PDF version"] = version.group(1).decode()
+    except (OSError, ValueError):
+        return {}
+    info["Encrypted"] = "no"
+    info["File size"] = f"{Path(path).stat().st_size} bytes"
+    return info
+
+def write_pdf_info(info, out_path):
+    # Same "Key:   value" layout as pdfinfo
+    with open(out_path, "w", encoding="utf-8") as f:
+        for key, value in info.items():
+            f.write(f"{key + ':':<16}{value}\n")
 
 def create_dir_structure(base_dir):
     ocr_dir = base_dir / "ocr"
@@ -48,61 +142,89 @@ def create_dir_structure(base_dir):
     return ocr_dir, images_dir, text_dir, meta_dir
 
 # ========== MAIN PROCESS ==========
-def process_pdf(pdf_path: Path):
+def process_pdf(pdf_path: Path, timestamp: str, deep_metadata: bool = False):
     print(f"\n🔍  Processing {pdf_path.name}")
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     safe_name = pdf_path.stem.replace(' ', '_')
-    base_dir = OUTPUT_BASE / f"{safe_name}_{timestamp}"
-    base_dir.mkdir(parents=True, exist_ok=True)
+    base_dir = make_output_dir(OUTPUT_BASE / f"{safe_name}_{timestamp}")
 
     ocr_dir, images_dir, text_dir, meta_dir = create_dir_structure(base_dir)
 
     # Copy original
-    shutil.copy(pdf_path, base_dir / "original.pdf")
+    link_or_copy(pdf_path, base_dir / "original.pdf")
+
+    # The tools are independent readers of the same file, so run them side by side
+    procs = []
 
-    # Extract metadata
-    run_cmd(f'pdfinfo "{pdf_path}"', meta_dir / "pdfinfo.txt")
-    run_cmd(f'exiftool "{pdf_path}"', meta_dir / "exiftool.txt")
+    # Extract metadata; pdfinfo only when the trailer scan cannot answer
+    info = fast_metadata(pdf_path)
+    if info:
+        write_pdf_info(info, meta_dir / "pdfinfo.txt")
+    else:
+        procs.append(run_cmd(["pdfinfo", str(pdf_path)], meta_dir / "pdfinfo.txt"))
+    if deep_metadata:
+        procs.append(run_cmd(["exiftool", str(pdf_path)], meta_dir / "exiftool.txt"))
 
     # Extract text
-    run_cmd(f'pdftotext "{pdf_path}" "{text_dir}/text.txt"', text_dir / "pdftotext_log.txt")
+    procs.append(run_cmd(["pdftotext", str(pdf_path), str(text_dir / "text.txt")], text_dir / "pdftotext_log.txt"))
 
     # Extract images
-    run_cmd(f'pdfimages -png "{pdf_path}" "{images_dir}/img"', images_dir / "pdfimages_log.txt")
+    procs.append(run_cmd(["pdfimages", "-png", str(pdf_path), str(images_dir / "img")], images_dir / "pdfimages_log.txt"))
 
     # OCR to PDF & HOCR + TXT (black & white, high DPI)
-    run_cmd(
-        f'ocrmypdf --force-ocr --output-type pdf --rotate-pages --deskew -l {LANGUAGES} '
-        f'--image-dpi {DPI} --sidecar "{ocr_dir}/ocr.txt" "{pdf_path}" "{ocr_dir}/ocr.pdf"',
+    procs.append(run_cmd(
+        ["ocrmypdf", "--force-ocr", "--output-type", "pdf", "--rotate-pages", "--deskew", "-l", LANGUAGES,
+         "--image-dpi", str(DPI), "--sidecar", str(ocr_dir / "ocr.txt"), str(pdf_path), str(ocr_dir / "ocr.pdf")],
         ocr_dir / "ocrmypdf_log.txt"
-    )
+    ))
+
+    wait_all(procs)
 
     return {
         "filename": pdf_path.name,
         "timestamp": timestamp,
-        "path": str(base_dir)
+        "path": str(base_dir),
+        "error": ""
     }
 
+def failed_row(pdf_path: Path, timestamp: str, error):
+    # For a PDF whose processing blew up, so it still shows in the summary
+    print(f"❌  Failed: {pdf_path}: {error}")
+    return {"filename": pdf_path.name, "timestamp": timestamp, "path": "", "error": str(error)}
+
 # ========== ENTRY ==========
 def main():
-    import sys
-    input_path = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+    parser = argparse.ArgumentParser(description="Forensic analysis of a PDF or a folder of PDFs")
+    parser.add_argument("input_path", nargs="?", type=Path, help="PDF file or folder")
+    parser.add_argument("--jobs", "-j", type=int, default=default_jobs(),
+                        help="Number of PDFs to process in parallel (default: half the CPUs)")
+    parser.add_argument("--deep-metadata", action="store_true",
+                        help="Also run exiftool for EXIF/XMP metadata")
+    args = parser.parse_args()
+
+    input_path = args.input_path
     if not input_path or not input_path.exists():
         print("❌  Please provide a valid file or folder path.")
         return
 
     OUTPUT_BASE.mkdir(exist_ok=True)
-    csv_file = OUTPUT_BASE / f"summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    # One timestamp for the whole run, shared by the output folders and the CSV
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_file = OUTPUT_BASE / f"summary_{timestamp}.csv"
     rows = []
 
-    pdf_files = [input_path] if input_path.is_file() else list(input_path.glob("*.pdf"))
-    for pdf in pdf_files:
-        info = process_pdf(pdf)
-        rows.append(info)
+    pdf_files = [input_path] if input_path.is_file() else list_pdfs(input_path)
+    with ProcessPoolExecutor(max_workers=args.jobs) as ex:
+        futures = {ex.submit(process_pdf, pdf, timestamp, args.deep_metadata): pdf for pdf in pdf_files}
+        for fut in as_completed(futures):
+            # One bad file must not take the batch (and its summary) down with it
+            try:
+                rows.append(fut.result())
+            except Exception as e:
+                rows.append(failed_row(futures[fut], timestamp, e))
 
     # Write summary CSV
     with open(csv_file, "w", newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=["filename", "timestamp", "path"])
+        writer = csv.DictWriter(f, fieldnames=["filename", "timestamp", "path", "error"])
         writer.writeheader()
         writer.writerows(rows)
 
@@ -14,35 +14,47 @@
 #         - Hex dump (-x)
 #         - OCR (-o)
 #         - Stream decoding (-d)
-#     - Uses common CLI tools: pdfinfo, exiftool, pdftotext, qpdf, mutool, grep, strings, xxd, pdfimages, ocrmypdf
+#     - Uses common CLI tools: pdfinfo, exiftool, pdftotext, qpdf, mutool, xxd, pdfimages, ocrmypdf
 #     - Generates organized output folders with extracted artifacts
 # Output:
-#   - Saved under: forensic_results/<pdf_name>_<timestamp>/
+#   - Saved under: forensic_results/<pdf_name>_<content hash>/
 #   - Includes raw tool output, organized assets, and logs
 #############################################
 
 import os
+import re
 import sys
+import json
+import mmap
+import hashlib
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from datetime import datetime
 import shutil
 
 ACTIONS = {
     "-m": "Metadata extraction (pdfinfo, exiftool)",
     "-t": "Text extraction (pdftotext)",
     "-s": "Structure analysis (qpdf, mutool)",
-    "-h": "Hidden text search (strings, grep)",
+    "-h": "Hidden text search (strings)",
     "-i": "Image extraction (pdfimages)",
     "-x": "Hex dump (xxd)",
     "-o": "OCR (ocrmypdf)",
     "-d": "Decode streams (qpdf --qdf)",
-    "--all": "Run all analyses"
+    "--all": "Run all analyses",
+    "--force": "Re-run analyses even if their output already exists"
 }
 
+OCR_LANGUAGES = "heb+eng"
+# Set OCR_SHARDED=1 to OCR page by page (pdftocairo | tesseract) into a text file
+OCR_SHARDED = os.environ.get("OCR_SHARDED", "") not in ("", "0")
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", os.cpu_count() or 1))
+
 REQUIRED_TOOLS = [
     "pdfinfo", "exiftool", "pdftotext", "qpdf", "mutool",
-    "strings", "grep", "xxd", "pdfimages", "ocrmypdf"
+    "xxd", "pdfimages", "ocrmypdf",
+    *(["pdftocairo", "tesseract"] if OCR_SHARDED else []),
 ]
 
 def check_tools():
@@ -50,56 +62,282 @@ def check_tools():
         if not shutil.which(tool):
             print(f"⚠️ WARNING: {tool} not found in PATH. Please install it!")
 
-def run_cmd(command, output_path=None):
+# qpdf exits with 3 when it succeeded but printed warnings
+QPDF_OK = (0, 3)
+
+def save_artifact(output_path, data, ok=True):
+    # An artifact only appears, atomically, once its step succeeded, so the
+    # skip-if-exists check never mistakes a failure for a finished step.
+    # A failed step's output is kept next to it as <name>.failed
+    output_path = Path(output_path)
+    failed_path = output_path.with_name(output_path.name + ".failed")
+    if not ok:
+        failed_path.write_bytes(data)
+        return
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, output_path)
+    failed_path.unlink(missing_ok=True)
+
+def run_cmd(argv, output_path=None, ok_codes=(0,)):
+    # Raises on failure so the task runner reports it and drops partial artifacts
+    result = subprocess.run(argv, capture_output=True)
+    output = result.stdout + result.stderr
+    ok = result.returncode in ok_codes
+    if output_path:
+        save_artifact(output_path, output, ok)
+    if not ok:
+        raise subprocess.CalledProcessError(result.returncode, argv, output)
+    return output
+
+def stream_cmd(argv, output_path):
+    # For large outputs (xxd): write stdout straight to disk, renamed into place on success
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        returncode = subprocess.run(argv, stdout=f, stderr=subprocess.DEVNULL, check=False).returncode
+    if returncode != 0:
+        tmp_path.unlink()
+        raise subprocess.CalledProcessError(returncode, argv)
+    os.replace(tmp_path, output_path)
+
+# GNU strings: runs of 4+ printable ASCII characters (tab included)
+PRINTABLE_RUN = re.compile(rb"[\x20-\x7e\t]{4,}")
+
+def extract_hidden_text(pdf_path, asset_dir):
+    # One pass over the memory-mapped PDF writes the strings dump and
+    # collects the same lines `grep -i hidden` and `grep -i OC` would match
+    hidden, optional_content = [], []
+    with open(asset_dir / "strings_dump.txt", 'wb') as dump, open(pdf_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for match in PRINTABLE_RUN.finditer(data):
+                    line = match.group() + b"\n"
+                    dump.write(line)
+                    lowered = line.lower()
+                    if b"hidden" in lowered:
+                        hidden.append(line)
+                    if b"oc" in lowered:
+                        optional_content.append(line)
+    save_artifact(asset_dir / "hidden_text.txt", b"".join(hidden + optional_content))
+
+@lru_cache(maxsize=None)
+def read_pdf_info(pdf):
+    # Run pdfinfo once per file; later steps reuse the parsed fields
+    output = run_cmd(["pdfinfo", pdf])
+    info = {}
+    for line in output.decode("utf-8", errors="replace").splitlines():
+        key, sep, value = line.partition(":")
+        if sep:
+            info[key.strip()] = value.strip()
+    return output, info
+
+def write_pdf_info(pdf, output_path):
+    try:
+        output, _ = read_pdf_info(pdf)
+    except subprocess.CalledProcessError as e:
+        save_artifact(output_path, e.output, ok=False)
+        raise
+    save_artifact(output_path, output)
+
+def qpdf_json_objects(data):
+    # qpdf >= 11 emits JSON v2 ("qpdf": [header, objects]); older ones v1 ("objects")
+    if isinstance(data.get("qpdf"), list) and len(data["qpdf"]) > 1:
+        return {k[4:]: v for k, v in data["qpdf"][1].items() if k.startswith("obj:")}
+    return data.get("objects")
+
+def describe_qpdf_object(obj):
+    if isinstance(obj, dict) and "stream" in obj:
+        stream_dict = obj["stream"].get("dict", {})
+        kind = stream_dict.get("/Type")
+        return f"stream {kind}" if kind else "stream"
+    if isinstance(obj, dict) and "value" in obj:
+        obj = obj["value"]
+    if isinstance(obj, dict):
+        kind = obj.get("/Type")
+        return f"dictionary {kind}" if kind else "dictionary"
+    if isinstance(obj, list):
+        return f"array [{len(obj)}]"
+    return json.dumps(obj, ensure_ascii=False)[:80]
+
+def analyze_structure(pdf, asset_dir):
+    # qpdf --json already holds the object table, so derive the object
+    # listing from it instead of parsing the PDF again with --show-objects
+    try:
+        result = subprocess.run(["qpdf", "--json", pdf], capture_output=True)
+    except OSError as e:
+        print(f"❌ Error running command: qpdf --json {pdf}\n{e}")
+        return
+    ok = result.returncode in QPDF_OK
+    save_artifact(asset_dir / "qpdf_structure.json", result.stdout if ok else result.stdout + result.stderr, ok)
+    if not ok:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stderr)
+    try:
+        objects = qpdf_json_objects(json.loads(result.stdout))
+    except ValueError:
+        objects = None
+    if not objects:
+        run_cmd(["qpdf", "--show-objects", pdf], asset_dir / "qpdf_objects.txt", QPDF_OK)
+        return
+    listing = "".join(f"{ref}: {describe_qpdf_object(obj)}\n" for ref, obj in objects.items())
+    save_artifact(asset_dir / "qpdf_objects.txt", listing.encode("utf-8"))
+
+def ocr_page(pdf, page, lang=OCR_LANGUAGES):
+    try:
+        render = subprocess.Popen(
+            ["pdftocairo", "-png", "-r", "300", "-singlefile", "-f", str(page), "-l", str(page), pdf, "-"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+    except OSError as e:
+        print(f"❌ Error running pdftocairo on page {page}: {e}")
+        return None
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if output_path:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(result.stdout + result.stderr)
-        return result.stdout + result.stderr
-    except Exception as e:
-        return f"❌ Error running command: {command}\n{e}"
-
-def perform_analysis(pdf_path, actions):
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_name = pdf_path.stem
-    output_dir = Path(f"forensic_results/{base_name}_{timestamp}")
+        result = subprocess.run(["tesseract", "-", "stdout", "-l", lang], stdin=render.stdout, capture_output=True)
+    except OSError as e:
+        print(f"❌ Error running tesseract on page {page}: {e}")
+        return None
+    finally:
+        render.stdout.close()
+        render.wait()
+    # None marks a failed page, so the whole text file is not kept
+    return result.stdout if result.returncode == 0 and render.returncode == 0 else None
+
+def run_sharded_ocr(pdf, output_path):
+    # Shard by page so every core stays busy; the page count comes from pdfinfo
+    try:
+        _, info = read_pdf_info(pdf)
+    except (OSError, subprocess.CalledProcessError):
+        info = {}
+    try:
+        pages = int(info.get("Pages", 0))
+    except ValueError:
+        pages = 0
+    if not pages:
+        print(f"❌ Could not read the page count of {pdf}; skipping sharded OCR.")
+        return
+    with ThreadPoolExecutor(max_workers=max(1, OCR_CONCURRENCY)) as executor:
+        texts = list(executor.map(ocr_page, [pdf] * pages, range(1, pages + 1)))
+    failed = sum(text is None for text in texts)
+    if failed:
+        raise RuntimeError(f"OCR failed on {failed} of {pages} pages")
+    save_artifact(output_path, b"".join(texts))
+
+def batch_exif_metadata(pdf_files):
+    # One exiftool process for the whole folder instead of one Perl startup per file
+    try:
+        result = subprocess.run(
+            ["exiftool", "-a", "-G1", "-s", "-j", "-@", "-"],
+            input="\n".join(str(pdf) for pdf in pdf_files).encode("utf-8"),
+            capture_output=True,
+        )
+        entries = json.loads(result.stdout)
+    except (OSError, ValueError):
+        return {}
+    return {entry.get("SourceFile"): entry for entry in entries}
+
+def format_exif_value(value):
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def write_exif_metadata(tags, output_path):
+    lines = "".join(
+        f"{key:<40}: {format_exif_value(value)}\n" for key, value in tags.items() if key != "SourceFile"
+    )
+    save_artifact(output_path, lines.encode("utf-8"))
+
+def extract_exif_metadata(pdf, output_path):
+    # Same exiftool flags and layout as the batched folder run
+    tags = batch_exif_metadata([pdf]).get(pdf)
+    if not tags:
+        raise RuntimeError(f"exiftool returned no metadata for {pdf}")
+    write_exif_metadata(tags, output_path)
+
+def run_task(task):
+    _, func, *args = task
+    return func(*args)
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+def results_dir(pdf_path, fingerprint):
+    # Name the output folder after the content hash so re-runs on an
+    # unchanged PDF reuse the artifacts already produced
+    return Path(f"forensic_results/{pdf_path.stem}_{fingerprint}")
+
+def perform_analysis(pdf_path, actions, exif_metadata=None, force=False, fingerprint=None):
+    output_dir = results_dir(pdf_path, fingerprint or file_fingerprint(pdf_path))
     asset_dir = output_dir / "assets"
     os.makedirs(asset_dir, exist_ok=True)
 
-    shutil.copy(pdf_path, output_dir / "original.pdf")
+    if force or not (output_dir / "original.pdf").exists():
+        shutil.copy(pdf_path, output_dir / "original.pdf")
 
     print(f"🔍 Processing: {pdf_path.name} → {output_dir}")
 
+    # Every tool only reads the PDF, so independent tasks run concurrently.
+    # Each task is (artifact, func, *args); a None artifact always runs.
+    pdf = str(pdf_path)
+    tasks = []
+
     if "-m" in actions or "--all" in actions:
-        run_cmd(f"pdfinfo \"{pdf_path}\"", asset_dir / "pdf_info.txt")
-        run_cmd(f"exiftool \"{pdf_path}\"", asset_dir / "exif_metadata.txt")
+        tasks.append(("pdf_info.txt", write_pdf_info, pdf, asset_dir / "pdf_info.txt"))
+        tags = (exif_metadata or {}).get(pdf)
+        if tags:
+            tasks.append(("exif_metadata.txt", write_exif_metadata, tags, asset_dir / "exif_metadata.txt"))
+        else:
+            tasks.append(("exif_metadata.txt", extract_exif_metadata, pdf, asset_dir / "exif_metadata.txt"))
 
     if "-t" in actions or "--all" in actions:
-        run_cmd(f"pdftotext \"{pdf_path}\" \"{asset_dir}/extracted_text.txt\"")
+        tasks.append(("extracted_text.txt", run_cmd, ["pdftotext", pdf, str(asset_dir / "extracted_text.txt")]))
 
     if "-s" in actions or "--all" in actions:
-        run_cmd(f"qpdf --json \"{pdf_path}\"", asset_dir / "qpdf_structure.json")
-        run_cmd(f"qpdf --show-objects \"{pdf_path}\"", asset_dir / "qpdf_objects.txt")
-        run_cmd(f"mutool info \"{pdf_path}\"", asset_dir / "mutool_info.txt")
-        run_cmd(f"mutool extract \"{pdf_path}\" \"{asset_dir}/mutool_objects\"")
+        tasks.append(("qpdf_objects.txt", analyze_structure, pdf, asset_dir))
+        tasks.append(("mutool_info.txt", run_cmd, ["mutool", "info", pdf], asset_dir / "mutool_info.txt"))
+        tasks.append((None, run_cmd, ["mutool", "extract", pdf, str(asset_dir / "mutool_objects")]))
 
     if "-h" in actions or "--all" in actions:
-        run_cmd(f"strings \"{pdf_path}\"", asset_dir / "strings_dump.txt")
-        run_cmd(f"grep -i hidden \"{asset_dir}/strings_dump.txt\"", asset_dir / "hidden_text.txt")
-        run_cmd(f"grep -i OC \"{asset_dir}/strings_dump.txt\" >> \"{asset_dir}/hidden_text.txt\"")
+        tasks.append(("hidden_text.txt", extract_hidden_text, pdf_path, asset_dir))
 
     if "-i" in actions or "--all" in actions:
-        run_cmd(f"pdfimages -all \"{pdf_path}\" \"{asset_dir}/image\"")
+        tasks.append(("image-*", run_cmd, ["pdfimages", "-all", pdf, str(asset_dir / "image")]))
 
     if "-x" in actions or "--all" in actions:
-        run_cmd(f"xxd \"{pdf_path}\"", asset_dir / "pdf_hex_dump.txt")
+        tasks.append(("pdf_hex_dump.txt", stream_cmd, ["xxd", pdf], asset_dir / "pdf_hex_dump.txt"))
 
     if "-o" in actions or "--all" in actions:
-        run_cmd(f"ocrmypdf \"{pdf_path}\" \"{asset_dir}/ocr_output.pdf\"")
+        if OCR_SHARDED:
+            tasks.append(("ocr_output.txt", run_sharded_ocr, pdf, asset_dir / "ocr_output.txt"))
+        else:
+            tasks.append(("ocr_output.pdf", run_cmd, ["ocrmypdf", pdf, str(asset_dir / "ocr_output.pdf")]))
 
     if "-d" in actions or "--all" in actions:
-        run_cmd(f"qpdf --qdf --object-streams=disable \"{pdf_path}\" \"{asset_dir}/decoded_output.pdf\"")
+        tasks.append(("decoded_output.pdf", run_cmd, ["qpdf", "--qdf", "--object-streams=disable", pdf, str(asset_dir / "decoded_output.pdf")], None, QPDF_OK))
+
+    tasks = [
+        task for task in tasks
+        if force or task[0] is None or not any(asset_dir.glob(task[0]))
+    ]
+    if tasks:
+        with ThreadPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1)) as executor:
+            # A failing step is reported on its own; the others keep running
+            futures = {executor.submit(run_task, task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    artifact, func, *_ = futures[future]
+                    print(f"❌ {func.__name__} failed: {e}")
+                    # Tools writing their own files may leave partial output behind
+                    for partial in asset_dir.glob(artifact) if artifact else []:
+                        if partial.is_file():
+                            partial.unlink()
 
     print(f"✅ Finished: {pdf_path.name} → {output_dir}")
 
@@ -114,12 +352,13 @@ def main():
     check_tools()
 
     if len(sys.argv) < 2:
-        print("Usage: python3 pdforensic.py <file-or-folder> [options]")
+        print("Usage: python3 pdforensic.py <file-or-folder> [options] [--force]")
         print("No file or folder provided. Exiting.")
         sys.exit(1)
 
     target_path = Path(sys.argv[1])
     selected_actions = sys.argv[2:] if len(sys.argv) > 2 else interactive_menu()
+    force = "--force" in selected_actions
 
     pdf_files = []
     if target_path.is_file() and target_path.suffix.lower() == ".pdf":
@@ -130,8 +369,18 @@ def main():
         print("❌ Invalid input. Must be a PDF file or a folder containing PDFs.")
         sys.exit(1)
 
+    # Hash each file once; the folder name and the exif batch both need it
+    fingerprints = {pdf: file_fingerprint(pdf) for pdf in pdf_files}
+    exif_metadata = None
+    if len(pdf_files) > 1 and ("-m" in selected_actions or "--all" in selected_actions):
+        # Only files still missing their exif artifact are worth an exiftool pass
+        pending = [pdf for pdf in pdf_files if force or not
+                   (results_dir(pdf, fingerprints[pdf]) / "assets" / "exif_metadata.txt").exists()]
+        if pending:
+            exif_metadata = batch_exif_metadata(pending)
+
     for pdf in pdf_files:
-        perform_analysis(pdf, selected_actions)
+        perform_analysis(pdf, selected_actions, exif_metadata, force, fingerprints[pdf])
 
 if __name__ == "__main__":
     main()
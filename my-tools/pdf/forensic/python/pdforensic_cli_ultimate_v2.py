@@ -6,29 +6,29 @@
 #   Features:
 #     - Processes a single PDF or a folder of PDFs
 #     - Extracts:
-#         - Metadata (pdfinfo, exiftool)
-#         - Text content (pdftotext)
-#         - Embedded images (pdfimages)
-#         - OCR with sidecar output (ocrmypdf)
+#         - Metadata (PyMuPDF; exiftool with --deep-metadata)
+#         - Text content (PyMuPDF, or pdftotext with --parser pdftotext)
+#         - Embedded images (PyMuPDF, or pdfimages with --use-pdfimages)
+#         - OCR with sidecar output (ocrmypdf, --skip-text by default; see --ocr-mode)
 #     - Creates organized timestamped folders:
 #         - metadata/, text/, images/, ocr_output/
 #     - Logs each run into a master CSV file for tracking
 # Output:
 #   - All outputs saved under: forensic_results/<filename>_<timestamp>/
-#   - OCR outputs stored under: ocr_force/<filename>/
+#   - OCR outputs stored under: ocr_force/<filename>_<timestamp>/
 #   - Summary CSV: forensic_results/summary_<timestamp>.csv
 #############################################
 
 import argparse
 import subprocess
-import sys
 import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
-from bs4 import BeautifulSoup
-import fitz  # PyMuPDF
-import shutil
-import csv
+
+from forensic_utils import default_jobs, list_pdfs, make_output_dir, resolve_tools
 
 BANNER = """\033[1;32m
 ██████╗ ███████╗██████╗ ███████╗ ██████╗ ██████╗ ███████╗███╗   ██╗██╗ ██████╗
@@ -42,95 +42,249 @@ BANNER = """\033[1;32m
 
 OUTPUT_DIR = Path("forensic_results")
 OCR_DIR = Path("ocr_force")
-CSV_FILE = OUTPUT_DIR / f"summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+CSV_HEADER = ["File Name", "Last Modified", "Full Path", "OCR Mode", "Retries", "Error"]
+OCR_MODES = ["skip-text", "redo-ocr", "force-ocr"]
+# ocrmypdf child_process_error / other_error; bad input, bad args or a missing
+# dependency (1, 2, 6, 8) and Ctrl-C (130) would fail the same way again
+OCR_TRANSIENT_EXIT = {7, 15}
+TOOLS = resolve_tools(["exiftool", "pdftotext", "pdfimages", "ocrmypdf"])
+
+# Shared by all pool workers so only --ocr-concurrency ocrmypdf runs overlap
+_ocr_slots = None
+
+def init_worker(ocr_slots):
+    global _ocr_slots
+    _ocr_slots = ocr_slots
+
+def acquire_ocr_slot(block=True):
+    return _ocr_slots is None or _ocr_slots.acquire(block)
+
+def release_ocr_slot():
+    if _ocr_slots is not None:
+        _ocr_slots.release()
 
-def run_cmd(cmd, out_path):
+def run_cmd(argv, out_path):
+    # Start the command without waiting; the child keeps its own handle on out_path
+    exe = TOOLS.get(argv[0])
+    if not exe:
+        print(f"⚠️ Skipping {argv[0]} (not installed)")
+        return None
     with open(out_path, "w") as f:
-        subprocess.run(cmd, shell=True, stdout=f, stderr=subprocess.STDOUT)
+        return subprocess.Popen([exe, *argv[1:]], stdout=f, stderr=subprocess.STDOUT)
 
-def extract_metadata(pdf, outdir):
-    run_cmd(f'pdfinfo "{pdf}"', outdir / "pdf_info.txt")
-    run_cmd(f'exiftool "{pdf}"', outdir / "exif_metadata.txt")
+def wait_checked(proc):
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args)
 
-def extract_text(pdf, outdir):
-    run_cmd(f'pdftotext "{pdf}" "{outdir}/text.txt"', outdir / "pdftotext_log.txt")
+def with_retry(fn, transient=None, max_attempts=3, base_delay=1.0):
+    # Retry transient failures (tmp space, Ghostscript hiccups) with doubling delays;
+    # an exit code outside `transient` is final and fails without another attempt
+    for attempt in range(max_attempts):
+        try:
+            fn()
+            return True, attempt
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"⚠️ Attempt {attempt + 1}/{max_attempts} failed: {e}")
+            if (isinstance(e, subprocess.CalledProcessError) and transient is not None
+                    and e.returncode not in transient):
+                return False, attempt
+            if attempt + 1 < max_attempts:
+                time.sleep(base_delay * 2 ** attempt)
+    return False, max_attempts - 1
 
-def extract_images(pdf, outdir):
-    outdir.mkdir(exist_ok=True, parents=True)
-    run_cmd(f'pdfimages -all "{pdf}" "{outdir}/img"', outdir / "image_log.txt")
+def extract_metadata(session, outdir, deep=False):
+    # Document info comes from the open session; exiftool only for EXIF/XMP on request
+    session.write_metadata(outdir / "pdf_info.txt")
+    if not deep:
+        return []
+    return [run_cmd(["exiftool", str(session.path)], outdir / "exif_metadata.txt")]
+
+def extract_text(session, outdir, parser="pymupdf"):
+    if parser == "pdftotext":
+        return [run_cmd(["pdftotext", str(session.path), str(outdir / "text.txt")], outdir / "pdftotext_log.txt")]
+    session.write_text(outdir)
+    return []
+
+def extract_images(session, outdir, use_pdfimages=False):
+    if use_pdfimages:
+        # poppler's own naming (img-000.png, ...) for workflows that depend on it
+        proc = run_cmd(["pdfimages", "-all", str(session.path), str(outdir / "img")],
+                       outdir / "pdfimages_log.txt")
+        if proc:
+            wait_checked(proc)
+        return
+    session.extract_images(outdir)
 
-def ocr_pdf(pdf, outdir, lang='heb+eng'):
+def ocr_pdf(pdf, outdir, lang='heb+eng', mode="skip-text", jobs=1):
     outdir.mkdir(exist_ok=True, parents=True)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     sidecar_txt = outdir / "ocr_output.txt"
     sidecar_hocr = outdir / "ocr_output.hocr"
     output_pdf = outdir / "ocr_output.pdf"
 
-    cmd = (
-        f'ocrmypdf --force-ocr --output-type pdf --rotate-pages --deskew '
-        f'-l {lang} --sidecar "{sidecar_txt}" --pdf-renderer hocr '
-        f'"{pdf}" "{output_pdf}"'
-    )
+    # --optimize 0 skips the image optimization pass; ocrmypdf rejects --deskew with --redo-ocr
+    cmd = [
+        TOOLS["ocrmypdf"], f"--{mode}", "--output-type", "pdf", "--optimize", "0", "--jobs", str(jobs),
+        "--rotate-pages", *([] if mode == "redo-ocr" else ["--deskew"]),
+        "-l", lang, "--sidecar", str(sidecar_txt), "--pdf-renderer", "hocr",
+        str(pdf), str(output_pdf),
+    ]
     print(f"🔧 Running OCR on: {pdf}")
-    result = subprocess.run(cmd, shell=True)
+    return subprocess.Popen(cmd)
 
-    if result.returncode != 0:
+def check_ocr(ok, outdir):
+    if not ok:
         print("❌ OCR failed.")
         return
 
-    if not sidecar_txt.exists():
+    if not (outdir / "ocr_output.txt").exists():
         print("⚠️ Sidecar text not found.")
     else:
         print("✅ OCR Text output created.")
 
-def update_csv_row(pdf_path):
+def csv_row(pdf_path, ocr_mode, retries, error=""):
     pdf_name = pdf_path.name
     mod_time = datetime.fromtimestamp(pdf_path.stat().st_mtime).isoformat()
-    with open(CSV_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([pdf_name, mod_time, str(pdf_path.resolve())])
+    # Retry counts for steps that eventually succeeded, "failed" for those that never did
+    retried = " ".join(f"{step}:{count}" for step, count in retries.items() if count)
+    return (pdf_name, mod_time, str(pdf_path.resolve()), ocr_mode, retried, error)
 
-def process_file(pdf):
+def failed_row(pdf_path, ocr_mode, error):
+    # For a file whose processing blew up entirely, so it still shows in the summary
+    print(f"❌ Failed: {pdf_path}: {error}")
+    return (pdf_path.name, "", str(pdf_path.resolve()), ocr_mode, "", str(error))
+
+def process_file(pdf, run_ts, parser="pymupdf", ocr_mode="skip-text", ocr_jobs=1, deep_metadata=False,
+                 use_pdfimages=False):
+    from pdf_session import PdfSession  # pulls in PyMuPDF; not needed for --help
     print(f"🔍 Processing: {pdf}")
-    base = OUTPUT_DIR / f"{pdf.stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-    base.mkdir(parents=True, exist_ok=True)
+    base = make_output_dir(OUTPUT_DIR / f"{pdf.stem}_{run_ts}")
 
     # תתי תיקובות
     meta_dir = base / "metadata"
     text_dir = base / "text"
     image_dir = base / "images"
-    ocr_dir = OCR_DIR / pdf.stem
+    ocr_dir = OCR_DIR / base.name
     meta_dir.mkdir(parents=True, exist_ok=True)
     text_dir.mkdir(parents=True, exist_ok=True)
     image_dir.mkdir(parents=True, exist_ok=True)
 
-    extract_metadata(pdf, meta_dir)
-    extract_text(pdf, text_dir)
-    extract_images(pdf, image_dir)
-    ocr_pdf(pdf, ocr_dir)
-    update_csv_row(pdf)
+    # Start OCR first if a slot is free and do the in-process work on a single
+    # parsed document while it runs; otherwise extract first and queue for OCR after
+    ocr_enabled = bool(TOOLS["ocrmypdf"])
+    if not ocr_enabled:
+        print("⚠️ Skipping OCR (ocrmypdf not installed)")
+    holding = False
+    ocr_proc = None
+    reuse = False
+    retries = {}
+    procs = []
+    error = ""
+
+    def run_ocr():
+        # The first attempt reuses the run started early, retries start a fresh one;
+        # an OSError from Popen counts as a failed attempt
+        nonlocal ocr_proc, reuse
+        if not reuse:
+            ocr_proc = ocr_pdf(pdf, ocr_dir, mode=ocr_mode, jobs=ocr_jobs)
+        reuse = False
+        wait_checked(ocr_proc)
+
+    try:
+        # Acquire and launch inside the try so the finally always gives the slot back
+        holding = ocr_enabled and acquire_ocr_slot(block=False)
+        if holding:
+            try:
+                ocr_proc = ocr_pdf(pdf, ocr_dir, mode=ocr_mode, jobs=ocr_jobs)
+                reuse = True
+            except OSError as e:
+                print(f"⚠️ Could not start OCR: {e}")
+        try:
+            with PdfSession(pdf) as session:
+                procs += extract_metadata(session, meta_dir, deep_metadata)
+                procs += extract_text(session, text_dir, parser)
+                if use_pdfimages:
+                    # Only the subprocess can fail transiently; PyMuPDF errors repeat
+                    images_ok, count = with_retry(lambda: extract_images(session, image_dir, True))
+                    retries["images"] = count if images_ok else "failed"
+                    if not images_ok:
+                        print("❌ Image extraction failed.")
+                else:
+                    extract_images(session, image_dir)
+        except Exception as e:
+            # Corrupt files fail to open, encrypted ones on page access; keep going with OCR
+            print(f"❌ Extraction failed: {e}")
+            error = str(e)
+        for proc in filter(None, procs):
+            proc.wait()
+        if ocr_enabled:
+            if not holding:
+                holding = acquire_ocr_slot()
+            ocr_ok, count = with_retry(run_ocr, OCR_TRANSIENT_EXIT)
+            retries["ocr"] = count if ocr_ok else "failed"
+            check_ocr(ocr_ok, ocr_dir)
+    finally:
+        if ocr_proc:
+            ocr_proc.wait()
+        if holding:
+            release_ocr_slot()
 
     print(f"✅ Done: {pdf}\n")
+    return csv_row(pdf, ocr_mode, retries, error)
 
 def main():
     print(BANNER)
     parser = argparse.ArgumentParser(description="PDF Forensic Analysis CLI")
     parser.add_argument("target", help="PDF file or folder")
+    parser.add_argument("--jobs", "-j", type=int, default=default_jobs(),
+                        help="Number of PDFs to process in parallel (default: half the CPUs)")
+    parser.add_argument("--parser", choices=["pymupdf", "pdftotext"], default="pymupdf",
+                        help="Text extraction backend (default: pymupdf)")
+    parser.add_argument("--ocr-mode", choices=OCR_MODES, default="skip-text",
+                        help="How ocrmypdf treats pages that already have text (default: skip-text)")
+    parser.add_argument("--ocr-concurrency", type=int, default=None,
+                        help="Max ocrmypdf runs at once across the pool (default: --jobs)")
+    parser.add_argument("--deep-metadata", action="store_true",
+                        help="Also run exiftool for EXIF/XMP metadata")
+    parser.add_argument("--use-pdfimages", action="store_true",
+                        help="Extract images with poppler's pdfimages instead of PyMuPDF")
     args = parser.parse_args()
 
+    # One timestamp for the whole run, shared by the output folders and the CSV
+    run_ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+    OUTPUT_DIR.mkdir(exist_ok=True)
+    OCR_DIR.mkdir(exist_ok=True)
+
     target = Path(args.target)
+    ocr_concurrency = max(1, min(args.ocr_concurrency or args.jobs, args.jobs))
+    # Split the CPUs between the OCR runs allowed side by side and each one's ocrmypdf workers
+    outer_jobs = ocr_concurrency if target.is_dir() else 1
+    ocr_jobs = max(1, (os.cpu_count() or 1) // outer_jobs)
+    rows = []
     if target.is_file() and target.suffix.lower() == ".pdf":
-        process_file(target)
+        try:
+            rows.append(process_file(target, run_ts, args.parser, args.ocr_mode, ocr_jobs, args.deep_metadata,
+                                     args.use_pdfimages))
+        except Exception as e:
+            rows.append(failed_row(target, args.ocr_mode, e))
     elif target.is_dir():
-        for pdf in target.glob("*.pdf"):
-            process_file(pdf)
+        ocr_slots = multiprocessing.BoundedSemaphore(ocr_concurrency)
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker,
+                                 initargs=(ocr_slots,)) as ex:
+            futures = {ex.submit(process_file, pdf, run_ts, args.parser, args.ocr_mode, ocr_jobs,
+                                 args.deep_metadata, args.use_pdfimages): pdf for pdf in list_pdfs(target)}
+            for fut in as_completed(futures):
+                # One bad file must not take the batch (and its summary) down with it
+                try:
+                    rows.append(fut.result())
+                except Exception as e:
+                    rows.append(failed_row(futures[fut], args.ocr_mode, e))
     else:
         print("❌ Invalid input. Please specify a .pdf file or folder containing PDFs.")
 
+    # Rows come back to the parent, so the summary is written once in one go
+    import csv
+    with open(OUTPUT_DIR / f"summary_{run_ts}.csv", "w", newline="") as f:
+        csv.writer(f).writerows([CSV_HEADER, *rows])
+
 if __name__ == "__main__":
-    OUTPUT_DIR.mkdir(exist_ok=True)
-    OCR_DIR.mkdir(exist_ok=True)
-    with open(CSV_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["File Name", "Last Modified", "Full Path"])
     main()
@@ -7,45 +7,85 @@
 #     - Checks for required command-line tools
 #     - Creates a timestamped output directory for organized results
 #     - Extracts metadata using pdfinfo and exiftool
-#     - Extracts visible and hidden text using pdftotext and grep
+#     - Extracts visible text using pdftotext and scans strings output for hidden text
 #     - Analyzes internal PDF structure using qpdf and mutool
 #     - Extracts embedded images using pdfimages
-#     - Dumps raw binary content with xxd
+#     - Dumps raw binary content as an xxd-style hex listing
 #     - Gathers all outputs into a Markdown report
 # Output:
 #   - All results are saved in: forensic_results/<pdf_name>_<timestamp>
 #   - Markdown report summarizing the analysis is included
 #############################################
 import os
+import re
 import sys
+import mmap
+import shutil
 import subprocess
 from pathlib import Path
 from datetime import datetime
 
+from forensic_utils import link_or_copy, make_output_dir, resolve_tools
+
 REQUIRED_TOOLS = [
     "pdfinfo", "exiftool", "pdftotext", "qpdf", "mutool",
-    "strings", "grep", "xxd", "pdfimages"
+    "strings", "pdfimages"
 ]
+TOOLS = resolve_tools(REQUIRED_TOOLS)
+
+# Lines of the strings dump mentioning hidden content or optional content (OC)
+HIDDEN_PATTERN = re.compile(rb'(?im)^.*(?:hidden|\bOC).*$')
+MMAP_THRESHOLD = 100 * 1024 * 1024  # mmap dumps larger than this instead of reading them
+HEX_CHUNK_SIZE = 64 * 1024  # multiple of the line width, so offsets stay aligned
+# Printable ASCII stays as-is in the hex dump text column, everything else becomes "."
+HEX_ASCII_TABLE = bytes(b if 0x20 <= b < 0x7f else 0x2e for b in range(256))
 
 def check_tools():
     missing = []
-    for tool in REQUIRED_TOOLS:
-        if not shutil.which(tool):
+    for tool, path in TOOLS.items():
+        if not path:
             print(f"⚠️ WARNING: {tool} not found. Please install it!")
             missing.append(tool)
     if missing:
         print("\nSome tools are missing. The script may not run properly.")
         print("Missing tools:", ", ".join(missing))
 
-def run_cmd(command, output_path=None):
+def run_cmd(argv, output_path=None):
+    # Output goes straight to the file; tools that write their own files get devnull
+    exe = TOOLS.get(argv[0])
+    if not exe:
+        print(f"⚠️ Skipping {argv[0]} (not installed)")
+        return
+    argv = [exe, *argv[1:]]
     try:
-        result = subprocess.run(command, shell=True, text=True, capture_output=True)
         if output_path:
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(result.stdout + result.stderr)
-        return result.stdout + result.stderr
+            with open(output_path, "wb") as f:
+                subprocess.run(argv, stdout=f, stderr=subprocess.STDOUT, check=False)
+        else:
+            subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
     except Exception as e:
-        return f"❌ Error running {command}: {e}"
+        print(f"❌ Error running {' '.join(argv)}: {e}")
+
+def search_hidden_text(strings_path, output_path):
+    matches = []
+    if strings_path.exists():
+        with open(strings_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    matches = HIDDEN_PATTERN.findall(buf)
+            else:
+                matches = HIDDEN_PATTERN.findall(f.read())
+    output_path.write_bytes(b"\n".join(matches))
+
+def dump_hex(src, dst, width=16):
+    with open(src, "rb") as fi, open(dst, "w", encoding="ascii") as fo:
+        off = 0
+        while chunk := fi.read(HEX_CHUNK_SIZE):
+            for i in range(0, len(chunk), width):
+                line = chunk[i:i + width]
+                text = line.translate(HEX_ASCII_TABLE).decode("ascii")
+                fo.write(f"{off + i:08x}: {line.hex(' '):<{width * 3}} {text}\n")
+            off += len(chunk)
 
 def main():
     if len(sys.argv) < 2:
@@ -59,28 +99,27 @@ def main():
 
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     base_name = input_file.stem
-    output_dir = Path(f"forensic_results/{base_name}_{timestamp}")
+    output_dir = make_output_dir(Path(f"forensic_results/{base_name}_{timestamp}"))
     asset_dir = output_dir / "assets"
     os.makedirs(asset_dir, exist_ok=True)
 
     print(f"🔍 Processing: {input_file.name} → Saving to {output_dir}")
     # Copy original
-    original_copy = output_dir / "original.pdf"
-    original_copy.write_bytes(input_file.read_bytes())
+    link_or_copy(input_file, output_dir / "original.pdf")
 
     # Run all tools
-    run_cmd(f'pdfinfo "{input_file}"', asset_dir / "pdf_info.txt")
-    run_cmd(f'exiftool "{input_file}"', asset_dir / "exif_metadata.txt")
-    run_cmd(f'pdftotext "{input_file}" "{asset_dir}/extracted_text.txt"')
-    run_cmd(f'qpdf --json "{input_file}"', asset_dir / "qpdf_structure.json")
-    run_cmd(f'qpdf --show-objects "{input_file}"', asset_dir / "qpdf_objects.txt")
-    run_cmd(f'mutool info "{input_file}"', asset_dir / "mutool_info.txt")
-    run_cmd(f'mutool extract "{input_file}" "{asset_dir}/mutool_objects"')
-    run_cmd(f'strings "{input_file}"', asset_dir / "strings_dump.txt")
-    run_cmd(f'grep -i hidden "{asset_dir}/strings_dump.txt"', asset_dir / "hidden_text.txt")
-    run_cmd(f'grep -i OC "{asset_dir}/strings_dump.txt" >> "{asset_dir}/hidden_text.txt"')
-    run_cmd(f'xxd "{input_file}"', asset_dir / "pdf_hex_dump.txt")
-    run_cmd(f'pdfimages -all "{input_file}" "{asset_dir}/image"')
+    pdf = str(input_file)
+    run_cmd(["pdfinfo", pdf], asset_dir / "pdf_info.txt")
+    run_cmd(["exiftool", pdf], asset_dir / "exif_metadata.txt")
+    run_cmd(["pdftotext", pdf, str(asset_dir / "extracted_text.txt")])
+    run_cmd(["qpdf", "--json", pdf], asset_dir / "qpdf_structure.json")
+    run_cmd(["qpdf", "--show-objects", pdf], asset_dir / "qpdf_objects.txt")
+    run_cmd(["mutool", "info", pdf], asset_dir / "mutool_info.txt")
+    run_cmd(["mutool", "extract", pdf, str(asset_dir / "mutool_objects")])
+    run_cmd(["strings", pdf], asset_dir / "strings_dump.txt")
+    search_hidden_text(asset_dir / "strings_dump.txt", asset_dir / "hidden_text.txt")
+    dump_hex(input_file, asset_dir / "pdf_hex_dump.txt")
+    run_cmd(["pdfimages", "-all", pdf, str(asset_dir / "image")])
 
     # Generate Markdown summary
     md_file = output_dir / f"{base_name}_report_{timestamp}.md"
@@ -91,8 +130,11 @@ def main():
         def write_section(title, path):
             f.write(f"## {title}\n")
             if Path(path).exists():
-                content = Path(path).read_text(encoding="utf-8", errors="ignore")
-                f.write(content + "\n\n")
+                # Copy the bytes through in 1 MiB blocks; flush first so the text layer stays in order
+                f.flush()
+                with open(path, "rb") as src:
+                    shutil.copyfileobj(src, f.buffer, 1 << 20)
+                f.write("\n\n")
             else:
                 f.write("No data found.\n\n")
 
@@ -105,6 +147,5 @@ def main():
     print(f"✅ Done! Report saved in {output_dir}")
 
 if __name__ == "__main__":
-    import shutil
     check_tools()
     main()